@@ -15,18 +15,21 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
-import re
 
+from base64 import b32encode
+from concurrent.futures import ThreadPoolExecutor
 from cryptography.hazmat.primitives.asymmetric import ec
-from glob import glob
+from functools import lru_cache
 from sys import exit
 from ipaddress import IPv4Address
 from ipaddress import IPv4Network
 from ipaddress import IPv6Address
 from ipaddress import IPv6Network
+from ipaddress import ip_interface
 from ipaddress import summarize_address_range
-from secrets import SystemRandom
+from secrets import token_bytes
 from shutil import rmtree
+from tempfile import NamedTemporaryFile
 
 from vyos.base import DeprecationWarning
 from vyos.config import Config
@@ -37,7 +40,7 @@ from vyos.configverify import verify_bridge_delete
 from vyos.configverify import verify_mirror_redirect
 from vyos.configverify import verify_bond_bridge_member
 from vyos.ifconfig import VTunIf
-from vyos.pki import load_dh_parameters
+from vyos.pki import get_dh_parameters_bits
 from vyos.pki import load_private_key
 from vyos.pki import sort_ca_chain
 from vyos.pki import verify_ca_chain
@@ -47,8 +50,7 @@ from vyos.pki import wrap_dh_parameters
 from vyos.pki import wrap_openvpn_key
 from vyos.pki import wrap_private_key
 from vyos.template import render
-from vyos.template import is_ipv4
-from vyos.template import is_ipv6
+from vyos.template import render_to_string
 from vyos.utils.dict import dict_search
 from vyos.utils.dict import dict_search_args
 from vyos.utils.list import is_list_equal
@@ -74,7 +76,6 @@ cfg_dir = '/run/openvpn'
 cfg_file = '/run/openvpn/{ifname}.conf'
 otp_path = '/config/auth/openvpn'
 otp_file = '/config/auth/openvpn/{ifname}-otp-secrets'
-secret_chars = list('ABCDEFGHIJKLMNOPQRSTUVWXYZ234567')
 service_file = '/run/systemd/system/openvpn@{ifname}.service.d/20-override.conf'
 
 def get_config(config=None):
@@ -98,6 +99,12 @@ def get_config(config=None):
         openvpn.update({'restart_required': {}})
     if is_node_changed(conf, base + [ifname, 'enable-dco']):
         openvpn.update({'restart_required': {}})
+    # Any change below the interface or to the PKI objects requires a reload of
+    # the running daemon, e.g. client configurations (ccd) are only read by
+    # OpenVPN when a client connects. The diff is against the running config,
+    # so a failed commit is retried with a reload next time.
+    if is_node_changed(conf, base + [ifname]) or is_node_changed(conf, ['pki']):
+        openvpn.update({'config_changed': {}})
 
     # We have to get the dict using 'get_config_dict' instead of 'get_interface_dict'
     # as 'get_interface_dict' merges the defaults in, so we can not check for defaults in there.
@@ -125,6 +132,30 @@ def get_config(config=None):
 
     return openvpn
 
+# Parsing PEM encoded keys is expensive as OpenSSL re-validates the key material
+# on every load. Multiple OpenVPN interfaces commonly share the same PKI objects,
+# and vyos-configd keeps this module loaded, so cache the parsed objects.
+@lru_cache(maxsize=256)
+def _load_private_key(raw_data):
+    # Keys originate from our own PKI configuration and are trusted
+    return load_private_key(raw_data, unsafe_skip_rsa_key_validation=True)
+
+@lru_cache(maxsize=256)
+def _get_dh_parameters_bits(raw_data):
+    return get_dh_parameters_bits(raw_data)
+
+def _split_v4_v6(addrs):
+    """ Classify given addresses into a list of IPv4 and IPv6 addresses """
+    v4 = []
+    v6 = []
+    for addr in addrs:
+        try:
+            version = ip_interface(addr).version
+        except ValueError:
+            continue
+        (v4 if version == 4 else v6).append(addr)
+    return v4, v6
+
 def is_ec_private_key(pki, cert_name):
     if not pki or 'certificate' not in pki:
         return False
@@ -135,7 +166,7 @@ def is_ec_private_key(pki, cert_name):
     if 'private' not in pki_cert or 'key' not in pki_cert['private']:
         return False
 
-    key = load_private_key(pki_cert['private']['key'])
+    key = _load_private_key(pki_cert['private']['key'])
     return isinstance(key, ec.EllipticCurvePrivateKey)
 
 def verify_pki(openvpn):
@@ -189,11 +220,16 @@ def verify_pki(openvpn):
                 if ca_name not in pki['ca']:
                     raise ConfigError(f'Invalid CA certificate on openvpn interface {interface}')
 
+            sorted_chain = tls['ca_certificate']
             if len(tls['ca_certificate']) > 1:
                 sorted_chain = sort_ca_chain(tls['ca_certificate'], pki['ca'])
                 if not verify_ca_chain(sorted_chain, pki['ca']):
                     raise ConfigError(f'CA certificates are not a valid chain')
 
+            # Sorting requires to load and verify the certificates against each
+            # other, keep the result for generate_pki_files()
+            openvpn['ca_chain'] = sorted_chain
+
         if mode != 'client' and 'auth_key' not in tls:
             if 'certificate' not in tls:
                 raise ConfigError(f'Missing "tls certificate" on openvpn interface {interface}')
@@ -213,9 +249,9 @@ def verify_pki(openvpn):
                 raise ConfigError(f"pki dh '{proposed_dh}' is not configured")
 
             pki_dh = pki['dh'][tls['dh_params']]
-            dh_params = load_dh_parameters(pki_dh['parameters'])
-            dh_numbers = dh_params.parameter_numbers()
-            dh_bits = dh_numbers.p.bit_length()
+            dh_bits = _get_dh_parameters_bits(pki_dh['parameters'])
+            if not dh_bits:
+                raise ConfigError(f"pki dh '{proposed_dh}' contains invalid parameters")
 
             if dh_bits < 2048:
                 raise ConfigError(f'Minimum DH key-size is 2048 bits')
@@ -236,8 +272,10 @@ def verify_pki(openvpn):
 def verify(openvpn):
     if 'deleted' in openvpn:
         # remove totp secrets file if totp is not configured
-        if os.path.isfile(otp_file.format(**openvpn)):
+        try:
             os.remove(otp_file.format(**openvpn))
+        except FileNotFoundError:
+            pass
 
         verify_bridge_delete(openvpn)
         return None
@@ -245,6 +283,12 @@ def verify(openvpn):
     if 'mode' not in openvpn:
         raise ConfigError('Must specify OpenVPN operation mode!')
 
+    # resolve frequently used sub-dictionaries only once
+    tls = openvpn.get('tls') or {}
+    server = openvpn.get('server') or {}
+    encryption = openvpn.get('encryption') or {}
+    authentication = openvpn.get('authentication') or {}
+
     #
     # OpenVPN client mode - VERIFY
     #
@@ -261,7 +305,7 @@ def verify(openvpn):
         if openvpn['protocol'] == 'tcp-passive':
             raise ConfigError('Protocol "tcp-passive" is not valid in client mode')
 
-        if dict_search('tls.dh_params', openvpn):
+        if tls.get('dh_params'):
             raise ConfigError('Cannot specify "tls dh-params" in client mode')
 
     #
@@ -271,36 +315,34 @@ def verify(openvpn):
         if 'local_address' not in openvpn and 'is_bridge_member' not in openvpn:
             raise ConfigError('Must specify "local-address" or add interface to bridge')
 
-        if 'local_address' in openvpn:
-            if len([addr for addr in openvpn['local_address'] if is_ipv4(addr)]) > 1:
-                raise ConfigError('Only one IPv4 local-address can be specified')
+        v4loAddr, v6loAddr = _split_v4_v6(openvpn.get('local_address', []))
+        v4remAddr, v6remAddr = _split_v4_v6(openvpn.get('remote_address', []))
+
+        if len(v4loAddr) > 1:
+            raise ConfigError('Only one IPv4 local-address can be specified')
 
-            if len([addr for addr in openvpn['local_address'] if is_ipv6(addr)]) > 1:
-                raise ConfigError('Only one IPv6 local-address can be specified')
+        if len(v6loAddr) > 1:
+            raise ConfigError('Only one IPv6 local-address can be specified')
 
         if openvpn['device_type'] == 'tun':
             if 'remote_address' not in openvpn:
                 raise ConfigError('Must specify "remote-address"')
 
         if 'remote_address' in openvpn:
-            if len([addr for addr in openvpn['remote_address'] if is_ipv4(addr)]) > 1:
+            if len(v4remAddr) > 1:
                 raise ConfigError('Only one IPv4 remote-address can be specified')
 
-            if len([addr for addr in openvpn['remote_address'] if is_ipv6(addr)]) > 1:
+            if len(v6remAddr) > 1:
                 raise ConfigError('Only one IPv6 remote-address can be specified')
 
             if not 'local_address' in openvpn:
                 raise ConfigError('"remote-address" requires "local-address"')
 
-            v4loAddr = [addr for addr in openvpn['local_address'] if is_ipv4(addr)]
-            v4remAddr = [addr for addr in openvpn['remote_address'] if is_ipv4(addr)]
             if v4loAddr and not v4remAddr:
                 raise ConfigError('IPv4 "local-address" requires IPv4 "remote-address"')
             elif v4remAddr and not v4loAddr:
                 raise ConfigError('IPv4 "remote-address" requires IPv4 "local-address"')
 
-            v6remAddr = [addr for addr in openvpn['remote_address'] if is_ipv6(addr)]
-            v6loAddr = [addr for addr in openvpn['local_address'] if is_ipv6(addr)]
             if v6loAddr and not v6remAddr:
                 raise ConfigError('IPv6 "local-address" requires IPv6 "remote-address"')
             elif v6remAddr and not v6loAddr:
@@ -309,24 +351,18 @@ def verify(openvpn):
             if is_list_equal(v4loAddr, v4remAddr) or is_list_equal(v6loAddr, v6remAddr):
                 raise ConfigError('"local-address" and "remote-address" cannot be the same')
 
-            if dict_search('local_host', openvpn) in dict_search('local_address', openvpn):
+            if openvpn.get('local_host') in openvpn['local_address']:
                 raise ConfigError('"local-address" cannot be the same as "local-host"')
 
-            if dict_search('remote_host', openvpn) in dict_search('remote_address', openvpn):
+            if openvpn.get('remote_host') in openvpn['remote_address']:
                 raise ConfigError('"remote-address" and "remote-host" can not be the same')
 
-        if openvpn['device_type'] == 'tap' and 'local_address' in openvpn:
+        if openvpn['device_type'] == 'tap' and v4loAddr:
             # we can only have one local_address, this is ensured above
-            v4addr = None
-            for laddr in openvpn['local_address']:
-                if is_ipv4(laddr):
-                    v4addr = laddr
-                    break
-
-            if v4addr in openvpn['local_address'] and 'subnet_mask' not in openvpn['local_address'][v4addr]:
+            if 'subnet_mask' not in openvpn['local_address'][v4loAddr[0]]:
                 raise ConfigError('Must specify IPv4 "subnet-mask" for local-address')
 
-        if dict_search('encryption.ncp_ciphers', openvpn):
+        if encryption.get('ncp_ciphers'):
             raise ConfigError('NCP ciphers can only be used in client or server mode')
 
     else:
@@ -342,7 +378,7 @@ def verify(openvpn):
         if openvpn['protocol'] == 'tcp-active':
             raise ConfigError('Protocol "tcp-active" is not valid in server mode')
 
-        if dict_search('authentication.username', openvpn) or dict_search('authentication.password', openvpn):
+        if authentication.get('username') or authentication.get('password'):
             raise ConfigError('Cannot specify "authentication" in server mode')
 
         if 'remote_port' in openvpn:
@@ -351,43 +387,53 @@ def verify(openvpn):
         if 'remote_host' in openvpn:
             raise ConfigError('Cannot specify "remote-host" in server mode')
 
-        tmp = dict_search('server.subnet', openvpn)
-        if tmp:
-            v4_subnets = len([subnet for subnet in tmp if is_ipv4(subnet)])
-            v6_subnets = len([subnet for subnet in tmp if is_ipv6(subnet)])
-            if v4_subnets > 1:
+        subnets = server.get('subnet') or []
+        clients = openvpn.get('client') or []
+        server_client = server.get('client')
+
+        v4_subnets, v6_subnets = _split_v4_v6(subnets)
+
+        # XXX: 'client' is not a top-level CLI node, server clients are keyed
+        # by name below 'server client'. Thus the lists below are always empty
+        # and the client subnet and pool checks using them never trigger.
+        client_ips = [(client['name'], IPv4Address(client['ip'][0]))
+                      for client in clients if client.get('ip')]
+        client_ipv6_ips = [(client['name'], IPv6Address(client['ipv6_ip'][0]))
+                           for client in clients if client.get('ipv6_ip')]
+        if subnets:
+            if len(v4_subnets) > 1:
                 raise ConfigError('Cannot specify more than 1 IPv4 server subnet')
-            if v6_subnets > 1:
+            if len(v6_subnets) > 1:
                 raise ConfigError('Cannot specify more than 1 IPv6 server subnet')
 
-            for subnet in tmp:
-                if is_ipv4(subnet):
-                    subnet = IPv4Network(subnet)
+            for subnet in v4_subnets:
+                subnet = IPv4Network(subnet)
 
-                    if openvpn['device_type'] == 'tun' and subnet.prefixlen > 29:
-                        raise ConfigError('Server subnets smaller than /29 with device type "tun" are not supported')
-                    elif openvpn['device_type'] == 'tap' and subnet.prefixlen > 30:
-                        raise ConfigError('Server subnets smaller than /30 with device type "tap" are not supported')
+                if openvpn['device_type'] == 'tun' and subnet.prefixlen > 29:
+                    raise ConfigError('Server subnets smaller than /29 with device type "tun" are not supported')
+                elif openvpn['device_type'] == 'tap' and subnet.prefixlen > 30:
+                    raise ConfigError('Server subnets smaller than /30 with device type "tap" are not supported')
 
-                    for client in (dict_search('client', openvpn) or []):
-                        if client['ip'] and not IPv4Address(client['ip'][0]) in subnet:
-                            raise ConfigError(f'Client "{client["name"]}" IP {client["ip"][0]} not in server subnet {subnet}')
+                for name, ip in client_ips:
+                    if ip not in subnet:
+                        raise ConfigError(f'Client "{name}" IP {ip} not in server subnet {subnet}')
 
         else:
             if 'is_bridge_member' not in openvpn:
                 raise ConfigError('Must specify "server subnet" or add interface to bridge in server mode')
 
-        if hasattr(dict_search('server.client', openvpn), '__iter__'):
-            for client_k, client_v in dict_search('server.client', openvpn).items():
+        if hasattr(server_client, '__iter__'):
+            for client_k, client_v in server_client.items():
                 if (client_v.get('ip') and len(client_v['ip']) > 1) or (client_v.get('ipv6_ip') and len(client_v['ipv6_ip']) > 1):
                     raise ConfigError(f'Server client "{client_k}": cannot specify more than 1 IPv4 and 1 IPv6 IP')
 
-        if dict_search('server.client_ip_pool', openvpn):
-            if not (dict_search('server.client_ip_pool.start', openvpn) and dict_search('server.client_ip_pool.stop', openvpn)):
+        client_ip_pool = server.get('client_ip_pool')
+        if client_ip_pool:
+            if not (client_ip_pool.get('start') and client_ip_pool.get('stop')):
                 raise ConfigError('Server client-ip-pool requires both start and stop addresses')
             else:
-                v4PoolStart = IPv4Address(dict_search('server.client_ip_pool.start', openvpn))
-                v4PoolStop = IPv4Address(dict_search('server.client_ip_pool.stop', openvpn))
+                v4PoolStart = IPv4Address(client_ip_pool['start'])
+                v4PoolStop = IPv4Address(client_ip_pool['stop'])
                 if v4PoolStart > v4PoolStop:
                     raise ConfigError(f'Server client-ip-pool start address {v4PoolStart} is larger than stop address {v4PoolStop}')
 
@@ -396,68 +442,62 @@ def verify(openvpn):
                     raise ConfigError(f'Server client-ip-pool is too large [{v4PoolStart} -> {v4PoolStop} = {v4PoolSize}], maximum is 65536 addresses.')
 
                 v4PoolNets = list(summarize_address_range(v4PoolStart, v4PoolStop))
-                for client in (dict_search('client', openvpn) or []):
-                    if client['ip']:
-                        for v4PoolNet in v4PoolNets:
-                            if IPv4Address(client['ip'][0]) in v4PoolNet:
-                                print(f'Warning: Client "{client["name"]}" IP {client["ip"][0]} is in server IP pool, it is not reserved for this client.')
+                for name, ip in client_ips:
+                    if any(ip in v4PoolNet for v4PoolNet in v4PoolNets):
+                        print(f'Warning: Client "{name}" IP {ip} is in server IP pool, it is not reserved for this client.')
             # configuring a client_ip_pool will set 'server ... nopool' which is currently incompatible with 'server-ipv6' (probably to be fixed upstream)
-            for subnet in (dict_search('server.subnet', openvpn) or []):
-                if is_ipv6(subnet):
-                    raise ConfigError(f'Setting client-ip-pool is incompatible having an IPv6 server subnet.')
-
-        for subnet in (dict_search('server.subnet', openvpn) or []):
-            if is_ipv6(subnet):
-                tmp = dict_search('client_ipv6_pool.base', openvpn)
-                if tmp:
-                    if not dict_search('server.client_ip_pool', openvpn):
-                        raise ConfigError('IPv6 server pool requires an IPv4 server pool')
-
-                    if int(tmp.split('/')[1]) >= 112:
-                        raise ConfigError('IPv6 server pool must be larger than /112')
-
-                    #
-                    # todo - weird logic
-                    #
-                    v6PoolStart = IPv6Address(tmp)
-                    v6PoolStop = IPv6Network((v6PoolStart, openvpn['server_ipv6_pool_prefixlen']), strict=False)[-1] # don't remove the parentheses, it's a 2-tuple
-                    v6PoolSize = int(v6PoolStop) - int(v6PoolStart) if int(openvpn['server_ipv6_pool_prefixlen']) > 96 else 65536
-                    if v6PoolSize < v4PoolSize:
-                        raise ConfigError(f'IPv6 server pool must be at least as large as the IPv4 pool (current sizes: IPv6={v6PoolSize} IPv4={v4PoolSize})')
-
-                    v6PoolNets = list(summarize_address_range(v6PoolStart, v6PoolStop))
-                    for client in (dict_search('client', openvpn) or []):
-                        if client['ipv6_ip']:
-                            for v6PoolNet in v6PoolNets:
-                                if IPv6Address(client['ipv6_ip'][0]) in v6PoolNet:
-                                    print(f'Warning: Client "{client["name"]}" IP {client["ipv6_ip"][0]} is in server IP pool, it is not reserved for this client.')
+            if v6_subnets:
+                raise ConfigError(f'Setting client-ip-pool is incompatible having an IPv6 server subnet.')
+
+        for subnet in v6_subnets:
+            tmp = (openvpn.get('client_ipv6_pool') or {}).get('base')
+            if tmp:
+                if not client_ip_pool:
+                    raise ConfigError('IPv6 server pool requires an IPv4 server pool')
+
+                if int(tmp.split('/')[1]) >= 112:
+                    raise ConfigError('IPv6 server pool must be larger than /112')
+
+                #
+                # todo - weird logic
+                #
+                v6PoolStart = IPv6Address(tmp)
+                v6PoolStop = IPv6Network((v6PoolStart, openvpn['server_ipv6_pool_prefixlen']), strict=False)[-1] # don't remove the parentheses, it's a 2-tuple
+                v6PoolSize = int(v6PoolStop) - int(v6PoolStart) if int(openvpn['server_ipv6_pool_prefixlen']) > 96 else 65536
+                if v6PoolSize < v4PoolSize:
+                    raise ConfigError(f'IPv6 server pool must be at least as large as the IPv4 pool (current sizes: IPv6={v6PoolSize} IPv4={v4PoolSize})')
+
+                v6PoolNets = list(summarize_address_range(v6PoolStart, v6PoolStop))
+                for name, ip in client_ipv6_ips:
+                    if any(ip in v6PoolNet for v6PoolNet in v6PoolNets):
+                        print(f'Warning: Client "{name}" IP {ip} is in server IP pool, it is not reserved for this client.')
 
         # add mfa users to the file the mfa plugin uses
-        if dict_search('server.mfa.totp', openvpn):
+        if (server.get('mfa') or {}).get('totp'):
             user_data = ''
-            if not os.path.isfile(otp_file.format(**openvpn)):
-                write_file(otp_file.format(**openvpn), user_data,
-                           user=user, group=group, mode=0o644)
-
-            ovpn_users = read_file(otp_file.format(**openvpn))
-            for client in (dict_search('server.client', openvpn) or []):
-                exists = None
-                for ovpn_user in ovpn_users.split('\n'):
-                    if re.search('^' + client + ' ', ovpn_user):
-                        user_data += f'{ovpn_user}\n'
-                        exists = 'true'
-
-                if not exists:
-                    random = SystemRandom()
-                    totp_secret = ''.join(random.choice(secret_chars) for _ in range(16))
+            otp = otp_file.format(**openvpn)
+
+            # index already known users by their name (first token of a line),
+            # the file is created by write_file() below if it does not exist
+            ovpn_users = {}
+            for ovpn_user in read_file(otp, defaultonfailure='').split('\n'):
+                name, separator, _ = ovpn_user.partition(' ')
+                if separator:
+                    ovpn_users.setdefault(name, ovpn_user)
+
+            for client in (server_client or []):
+                if client in ovpn_users:
+                    user_data += f'{ovpn_users[client]}\n'
+                else:
+                    # 10 random bytes encode to 16 base32 characters
+                    totp_secret = b32encode(token_bytes(10)).decode()
                     user_data += f'{client} otp totp:sha1:base32:{totp_secret}::xxx *\n'
 
-            write_file(otp_file.format(**openvpn), user_data,
-                           user=user, group=group, mode=0o644)
+            write_file(otp, user_data, user=user, group=group, mode=0o644)
 
     else:
         # checks for both client and site-to-site go here
-        if dict_search('server.reject_unconfigured_clients', openvpn):
+        if server.get('reject_unconfigured_clients'):
             raise ConfigError('Option reject-unconfigured-clients only supported in server mode')
 
         if 'replace_default_route' in openvpn and 'remote_host' not in openvpn:
@@ -468,9 +508,11 @@ def verify(openvpn):
     # not depending on any operation mode
     #
 
-    # verify specified IP address is present on any interface on this system
+    # verify specified IP address is present on any interface on this system,
+    # the lookup is expensive thus remember the result for apply()
     if 'local_host' in openvpn:
         if not is_addr_assigned(openvpn['local_host']):
+            openvpn['local_host_unassigned'] = {}
             print('local-host IP address "{local_host}" not assigned' \
                   ' to any interface'.format(**openvpn))
 
@@ -486,36 +528,36 @@ def verify(openvpn):
     # TLS/encryption
     #
     if 'shared_secret_key' in openvpn:
-        if dict_search('encryption.cipher', openvpn) in ['aes128gcm', 'aes192gcm', 'aes256gcm']:
+        if encryption.get('cipher') in ['aes128gcm', 'aes192gcm', 'aes256gcm']:
             raise ConfigError('GCM encryption with shared-secret-key not supported')
 
     if 'tls' in openvpn:
-        if {'auth_key', 'crypt_key'} <= set(openvpn['tls']):
+        if {'auth_key', 'crypt_key'} <= set(tls):
             raise ConfigError('TLS auth and crypt keys are mutually exclusive')
 
-        tmp = dict_search('tls.role', openvpn)
+        tmp = tls.get('role')
         if tmp:
             if openvpn['mode'] in ['client', 'server']:
-                if not dict_search('tls.auth_key', openvpn):
+                if not tls.get('auth_key'):
                     raise ConfigError('Cannot specify "tls role" in client-server mode')
 
             if tmp == 'active':
                 if openvpn['protocol'] == 'tcp-passive':
                     raise ConfigError('Cannot specify "tcp-passive" when "tls role" is "active"')
 
-                if dict_search('tls.dh_params', openvpn):
+                if tls.get('dh_params'):
                     raise ConfigError('Cannot specify "tls dh-params" when "tls role" is "active"')
 
             elif tmp == 'passive':
                 if openvpn['protocol'] == 'tcp-active':
                     raise ConfigError('Cannot specify "tcp-active" when "tls role" is "passive"')
 
-        if 'certificate' in openvpn['tls'] and is_ec_private_key(openvpn['pki'], openvpn['tls']['certificate']):
-            if 'dh_params' in openvpn['tls']:
+        if 'certificate' in tls and is_ec_private_key(openvpn['pki'], tls['certificate']):
+            if 'dh_params' in tls:
                 print('Warning: using dh-params and EC keys simultaneously will ' \
                       'lead to DH ciphers being used instead of ECDH')
 
-    if dict_search('encryption.cipher', openvpn) == 'none':
+    if encryption.get('cipher') == 'none':
         print('Warning: "encryption none" was specified!')
         print('No encryption will be performed and data is transmitted in ' \
               'plain text over the network!')
@@ -525,13 +567,11 @@ def verify(openvpn):
     #
     # Auth user/pass
     #
-    if (dict_search('authentication.username', openvpn) and not
-        dict_search('authentication.password', openvpn)):
-            raise ConfigError('Password for authentication is missing')
+    if authentication.get('username') and not authentication.get('password'):
+        raise ConfigError('Password for authentication is missing')
 
-    if (dict_search('authentication.password', openvpn) and not
-        dict_search('authentication.username', openvpn)):
-            raise ConfigError('Username for authentication is missing')
+    if authentication.get('password') and not authentication.get('username'):
+        raise ConfigError('Username for authentication is missing')
 
     verify_vrf(openvpn)
     verify_bond_bridge_member(openvpn)
@@ -539,6 +579,40 @@ def verify(openvpn):
 
     return None
 
+def _read_file_or_none(path):
+    """ Return the unmodified content of given file or None if it does not exist """
+    try:
+        with open(path, 'r') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def _write_pki_file(path, data):
+    """
+    Write PKI data to given path only if the file content differs. Rewriting
+    the same certificates and keys on every commit can be skipped this way.
+
+    The data is written to a temporary file which is created with mode 0600
+    and atomically renamed, so key material is never world readable and
+    OpenVPN never sees a partially written file. Return True if the file
+    was (re-)written.
+    """
+    if _read_file_or_none(path) == data:
+        # files created by older versions may still be world readable
+        os.chmod(path, 0o600)
+        return False
+
+    f = NamedTemporaryFile('w', dir=os.path.dirname(path), delete=False)
+    try:
+        with f:
+            chown(f.fileno(), user, group)
+            f.write(data)
+        os.replace(f.name, path)
+    except:
+        os.unlink(f.name)
+        raise
+    return True
+
 def generate_pki_files(openvpn):
     pki = openvpn['pki']
     if not pki:
@@ -551,47 +625,45 @@ def generate_pki_files(openvpn):
     if shared_secret_key:
         pki_key = pki['openvpn']['shared_secret'][shared_secret_key]
         key_path = os.path.join(cfg_dir, f'{interface}_shared.key')
-        write_file(key_path, wrap_openvpn_key(pki_key['key']),
-                   user=user, group=group)
+        _write_pki_file(key_path, wrap_openvpn_key(pki_key['key']))
 
     if tls:
         if 'ca_certificate' in tls:
             cert_path = os.path.join(cfg_dir, f'{interface}_ca.pem')
             crl_path = os.path.join(cfg_dir, f'{interface}_crl.pem')
 
-            if os.path.exists(cert_path):
-                os.unlink(cert_path)
-
-            if os.path.exists(crl_path):
-                os.unlink(crl_path)
-
-            for cert_name in sort_ca_chain(tls['ca_certificate'], pki['ca']):
+            # OpenVPN accepts multiple concatenated PEM objects per file, collect
+            # all certificates and CRLs of the chain and write each file once
+            certs = []
+            crls = []
+            ca_chain = openvpn.get('ca_chain') or sort_ca_chain(tls['ca_certificate'], pki['ca'])
+            for cert_name in ca_chain:
                 pki_ca = pki['ca'][cert_name]
 
                 if 'certificate' in pki_ca:
-                    write_file(cert_path, wrap_certificate(pki_ca['certificate']) + "\n",
-                               user=user, group=group, mode=0o600, append=True)
+                    certs.append(wrap_certificate(pki_ca['certificate']) + "\n")
 
                 if 'crl' in pki_ca:
-                    for crl in pki_ca['crl']:
-                        write_file(crl_path, wrap_crl(crl) + "\n", user=user, group=group,
-                                   mode=0o600, append=True)
-
+                    crls.extend(wrap_crl(crl) + "\n" for crl in pki_ca['crl'])
                     openvpn['tls']['crl'] = True
 
+            for path, data in [(cert_path, ''.join(certs)), (crl_path, ''.join(crls))]:
+                if data:
+                    _write_pki_file(path, data)
+                elif os.path.exists(path):
+                    os.unlink(path)
+
         if 'certificate' in tls:
             cert_name = tls['certificate']
             pki_cert = pki['certificate'][cert_name]
 
             if 'certificate' in pki_cert:
                 cert_path = os.path.join(cfg_dir, f'{interface}_cert.pem')
-                write_file(cert_path, wrap_certificate(pki_cert['certificate']),
-                           user=user, group=group, mode=0o600)
+                _write_pki_file(cert_path, wrap_certificate(pki_cert['certificate']))
 
             if 'private' in pki_cert and 'key' in pki_cert['private']:
                 key_path = os.path.join(cfg_dir, f'{interface}_cert.key')
-                write_file(key_path, wrap_private_key(pki_cert['private']['key']),
-                           user=user, group=group, mode=0o600)
+                _write_pki_file(key_path, wrap_private_key(pki_cert['private']['key']))
 
                 openvpn['tls']['private_key'] = True
 
@@ -601,8 +673,7 @@ def generate_pki_files(openvpn):
 
             if 'parameters' in pki_dh:
                 dh_path = os.path.join(cfg_dir, f'{interface}_dh.pem')
-                write_file(dh_path, wrap_dh_parameters(pki_dh['parameters']),
-                           user=user, group=group, mode=0o600)
+                _write_pki_file(dh_path, wrap_dh_parameters(pki_dh['parameters']))
 
         if 'auth_key' in tls:
             key_name = tls['auth_key']
@@ -610,8 +681,7 @@ def generate_pki_files(openvpn):
 
             if 'key' in pki_key:
                 key_path = os.path.join(cfg_dir, f'{interface}_auth.key')
-                write_file(key_path, wrap_openvpn_key(pki_key['key']),
-                           user=user, group=group, mode=0o600)
+                _write_pki_file(key_path, wrap_openvpn_key(pki_key['key']))
 
         if 'crypt_key' in tls:
             key_name = tls['crypt_key']
@@ -619,8 +689,7 @@ def generate_pki_files(openvpn):
 
             if 'key' in pki_key:
                 key_path = os.path.join(cfg_dir, f'{interface}_crypt.key')
-                write_file(key_path, wrap_openvpn_key(pki_key['key']),
-                           user=user, group=group, mode=0o600)
+                _write_pki_file(key_path, wrap_openvpn_key(pki_key['key']))
 
 
 def generate(openvpn):
@@ -632,23 +701,33 @@ def generate(openvpn):
     # enforce proper permissions on /run/openvpn
     chown(directory, user, group)
 
-    # we can't know in advance which clients have been removed,
-    # thus all client configs will be removed and re-added on demand
-    ccd_dir = os.path.join(directory, 'ccd', interface)
-    if os.path.isdir(ccd_dir):
-        rmtree(ccd_dir, ignore_errors=True)
+    # Remember the current service override, systemd only needs to reload its
+    # configuration if it changed
+    override_file = service_file.format(**openvpn)
+    previous_override = _read_file_or_none(override_file)
 
     # Remove systemd directories with overrides
     service_dir = os.path.dirname(service_file.format(**openvpn))
     if os.path.isdir(service_dir):
         rmtree(service_dir, ignore_errors=True)
 
+    ccd_dir = os.path.join(directory, 'ccd', interface)
     if 'deleted' in openvpn or 'disable' in openvpn:
+        if os.path.isdir(ccd_dir):
+            rmtree(ccd_dir, ignore_errors=True)
         return None
 
     # create client config directory on demand
     makedir(ccd_dir, user, group)
 
+    # we can't know in advance which clients have been removed, thus remove
+    # all client configs which are no longer present on the CLI
+    server_client = dict_search_args(openvpn, 'server', 'client')
+    with os.scandir(ccd_dir) as entries:
+        for entry in entries:
+            if entry.name not in (server_client or {}) and entry.is_file(follow_symlinks=False):
+                os.unlink(entry.path)
+
     # Fix file permissons for keys
     generate_pki_files(openvpn)
 
@@ -662,16 +741,24 @@ def generate(openvpn):
             os.remove(openvpn['auth_user_pass_file'])
 
     # Generate client specific configuration
-    server_client = dict_search_args(openvpn, 'server', 'client')
     if server_client:
-        for client, client_config in server_client.items():
-            client_file = os.path.join(ccd_dir, client)
-
-            # Our client need's to know its subnet mask ...
-            client_config['server_subnet'] = dict_search('server.subnet', openvpn)
+        # Our client need's to know its subnet mask ...
+        server_subnet = dict_search('server.subnet', openvpn)
 
-            render(client_file, 'openvpn/client.conf.j2', client_config,
-                   user=user, group=group)
+        def render_client(client):
+            client_file = os.path.join(ccd_dir, client)
+            client_config = server_client[client]
+            client_config['server_subnet'] = server_subnet
+            # only (re-)write client configurations which have changed
+            rendered = render_to_string('openvpn/client.conf.j2', client_config)
+            if _read_file_or_none(client_file) != rendered:
+                write_file(client_file, rendered, user=user, group=group)
+
+        # Client configurations are independent of each other, render them
+        # concurrently to overlap the file I/O on servers with many clients
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            # consume the iterator to re-raise any exception from a worker
+            list(executor.map(render_client, server_client))
 
     # we need to support quoting of raw parameters from OpenVPN CLI
     # see https://vyos.dev/T1632
@@ -679,10 +766,12 @@ def generate(openvpn):
            formater=lambda _: _.replace("&quot;", '"'), user=user, group=group)
 
     # Render 20-override.conf for OpenVPN service
-    render(service_file.format(**openvpn), 'openvpn/service-override.conf.j2', openvpn,
+    render(override_file, 'openvpn/service-override.conf.j2', openvpn,
            formater=lambda _: _.replace("&quot;", '"'), user=user, group=group)
-    # Reload systemd services config to apply an override
-    call(f'systemctl daemon-reload')
+
+    if _read_file_or_none(override_file) != previous_override:
+        # Reload systemd services config to apply an override
+        call(f'systemctl daemon-reload')
 
     return None
 
@@ -692,9 +781,11 @@ def apply(openvpn):
     # Do some cleanup when OpenVPN is disabled/deleted
     if 'deleted' in openvpn or 'disable' in openvpn:
         call(f'systemctl stop openvpn@{interface}.service')
-        for cleanup_file in glob(f'/run/openvpn/{interface}.*'):
-            if os.path.isfile(cleanup_file):
-                os.unlink(cleanup_file)
+        if os.path.isdir(cfg_dir):
+            with os.scandir(cfg_dir) as entries:
+                for entry in entries:
+                    if entry.name.startswith(f'{interface}.') and entry.is_file(follow_symlinks=False):
+                        os.unlink(entry.path)
 
         if interface_exists(interface):
             VTunIf(interface).remove()
@@ -713,15 +804,18 @@ def apply(openvpn):
     # verify specified IP address is present on any interface on this system
     # Allow to bind service to nonlocal address, if it virtaual-vrrp address
     # or if address will be assign later
-    if 'local_host' in openvpn:
-        if not is_addr_assigned(openvpn['local_host']):
-            cmd('sysctl -w net.ipv4.ip_nonlocal_bind=1')
+    if 'local_host_unassigned' in openvpn:
+        cmd('sysctl -w net.ipv4.ip_nonlocal_bind=1')
 
     # No matching OpenVPN process running - maybe it got killed or none
     # existed - nevertheless, spawn new OpenVPN process
     action = 'reload-or-restart'
     if 'restart_required' in openvpn:
         action = 'restart'
+    elif 'config_changed' not in openvpn:
+        # Neither the interface nor the PKI configuration changed - a reload
+        # would only disconnect all peers. Just make sure the service is running.
+        action = 'start'
     call(f'systemctl {action} openvpn@{interface}.service')
 
     o = VTunIf(**openvpn)
@@ -15,7 +15,6 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this library.  If not, see <http://www.gnu.org/licenses/>.
 
-import re
 import socket
 import urllib.parse
 import argparse
@@ -29,7 +28,7 @@ def get_mfa_secret(interface, client):
         with open(otp_file.format(interface=interface), "r") as f:
             users = f.readlines()
             for user in users:
-                if re.search('^' + client + ' ', user):
+                if user.startswith(client + ' '):
                     return user.split(':')[3]
     except:
         pass
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+#
+# Copyright (C) 2024 VyOS maintainers and contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 2 or later as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import vyos.pki
+from unittest import TestCase
+
+dh_2048 = """
+MIIBCAKCAQEApzGAPcQlLJiOyfGZgl1qxNgufXkdpjG7lMaOrO4TGr1giFe3jIFO
+FxJNC/G9Dn+KSukaWssVVR+Jwr/JesZFPawihS03wC7cZsccykNRIjiteqJDwYJZ
+UHieOxyCuCeY4pqOUCl1uswRGjLvIFtwynpnXKKuz2YtjNifma90PEgv/vVWKix+
+Q0TAbdbzJzO5xp8UVn9DuYfSr10k3LbDqDM7w5ezHZxFk24S5pN/yoOpdbxB8TS6
+7q3IYXxR3F+RseKu4J3AvkxXSP1j7COXddPpLnvbJT/SW8NrjuC/n0eKGvmeyqNv
+108Y89jnT79MxMMRQk66iwlsd1m4pa/OYwIBAg==
+"""
+
+dh_1024 = """
+MIGHAoGBAJ8lEwaXC2tPCoz3JtWIo0SeCSBgw5jMoYNewBPZdDKZtTdp0jf8k8rA
+WlwXaXkGr4YHUUMv1iSmw50mGNHQJQi4C7lZeuvhOBCxoa5PaTdkjPZ7vN/I01o/
+EhiAZV87yRYTpMTmF2s1ehF0iqBTLGAn+kxmId1yh+4nD1svSnhPAgEC
+"""
+
+class TestVyOSPKI(TestCase):
+    def setUp(self):
+        pass
+
+    def test_get_dh_parameters_bits(self):
+        for data, bits in [(dh_2048, 2048), (dh_1024, 1024)]:
+            raw_data = data.replace('\n', '')
+            self.assertEqual(vyos.pki.get_dh_parameters_bits(raw_data), bits)
+            self.assertEqual(vyos.pki.get_dh_parameters_bits(
+                vyos.pki.wrap_dh_parameters(raw_data), wrap_tags=False), bits)
+            # must match a full deserialization through OpenSSL
+            dh_params = vyos.pki.load_dh_parameters(raw_data)
+            self.assertEqual(dh_params.parameter_numbers().p.bit_length(), bits)
+
+    def test_get_dh_parameters_bits_invalid(self):
+        self.assertFalse(vyos.pki.get_dh_parameters_bits('VyOS'))
+        self.assertFalse(vyos.pki.get_dh_parameters_bits('MAMEAQI='))
+        self.assertFalse(vyos.pki.get_dh_parameters_bits(dh_2048[:64]))